@@ -0,0 +1,188 @@
+import asyncio
+import gzip
+import hashlib
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; fall back to gzip only
+    brotli = None
+
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class PrecompressedBody:
+    """Serialized bytes plus gzip and brotli variants, built once.
+
+    Each variant gets its own strong ETag, since the encoded bytes differ.
+    """
+    __slots__ = ("etags", "variants")
+
+    def __init__(self, body: bytes, digest: str):
+        self.variants: Dict[Optional[str], bytes] = {None: body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+        self.etags = {
+            encoding: f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+            for encoding in self.variants
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against ``etag`` (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class PrecompressedCache:
+    """LRU of precompressed bodies keyed by content hash.
+
+    Keying by content means a catalog change produces a new entry on first
+    request with no explicit invalidation; unchanged catalogs only pay for
+    serialization and a hash. Compression runs in a worker thread, and
+    concurrent misses for the same body share one computation.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+
+    async def get(self, body: bytes) -> PrecompressedBody:
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        future = self._entries.get(digest)
+        if future is None:
+            future = self._entries[digest] = asyncio.ensure_future(
+                asyncio.to_thread(PrecompressedBody, body, digest)
+            )
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(digest)
+        try:
+            # shield: a cancelled request must not cancel the shared computation
+            return await asyncio.shield(future)
+        except Exception:
+            if self._entries.get(digest) is future:
+                del self._entries[digest]
+            raise
+
+    async def response(self, request: Request, body: bytes, media_type: str = "application/json") -> Response:
+        entry = await self.get(body)
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        headers = {"ETag": entry.etags[encoding], "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), entry.etags[encoding]):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(content=entry.variants[encoding], media_type=media_type, headers=headers)
+
+
+def _compressor(encoding: str):
+    """Return a (compress, finish) pair for a streaming encoder."""
+    if encoding == "br":
+        obj = brotli.Compressor(quality=4)
+        return obj.process, obj.finish
+    # wbits=31 writes a gzip header and trailer
+    obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return obj.compress, obj.flush
+
+
+class CompressionMiddleware:
+    """Streaming gzip/brotli for responses at or above ``minimum_size``.
+
+    Responses that already carry a Content-Encoding (the precompressed catalog)
+    pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compress = finish = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compress, finish, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                passthrough = "content-encoding" in Headers(raw=message["headers"])
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                if start_message is not None:
+                    await send(start_message)
+                    start_message = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                compress, finish = _compressor(encoding)
+                await send(start_message)
+                start_message = None
+
+            chunk = compress(body)
+            if not more_body:
+                chunk += finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
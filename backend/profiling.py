@@ -0,0 +1,298 @@
+import asyncio
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+
+# Settings that can be changed at runtime and are shared through ring_dir
+RUNTIME_SETTINGS = ("sample_rate", "slow_request_ms")
+SETTINGS_CHECK_INTERVAL = 1.0
+
+
+@dataclass
+class ProfilingConfig:
+    """Runtime-adjustable profiling settings, seeded from the environment.
+
+    Runtime changes are written to ``settings.json`` in ``ring_dir`` and picked
+    up by every worker sharing that directory; delete the file to fall back to
+    the environment on the next restart.
+    """
+    token: Optional[str] = None
+    sample_rate: float = 0.0
+    slow_request_ms: float = 1000.0
+    interval_ms: float = 5.0
+    ring_dir: Path = Path(tempfile.gettempdir()) / "levelup-profiles"
+    ring_size: int = 64
+    _settings_mtime: int = field(default=0, init=False, repr=False)
+    _next_check: float = field(default=0.0, init=False, repr=False)
+
+    @classmethod
+    def from_env(cls):
+        defaults = cls()
+        ring_size = int(os.environ.get("PROFILE_RING_SIZE", defaults.ring_size))
+        if ring_size <= 0:
+            raise ValueError(f"PROFILE_RING_SIZE must be positive, got {ring_size}")
+        return cls(
+            token=os.environ.get("PROFILE_TOKEN") or None,
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", defaults.sample_rate)),
+            slow_request_ms=float(os.environ.get("SLOW_REQUEST_MS", defaults.slow_request_ms)),
+            interval_ms=float(os.environ.get("PROFILE_INTERVAL_MS", defaults.interval_ms)),
+            ring_dir=Path(os.environ.get("PROFILE_DIR", defaults.ring_dir)),
+            ring_size=ring_size,
+        )
+
+    def is_authorized(self, token: Optional[bytes]) -> bool:
+        # Compare raw header bytes: compare_digest rejects non-ASCII str arguments
+        return bool(self.token and token and secrets.compare_digest(self.token.encode(), token))
+
+    @property
+    def settings_path(self) -> Path:
+        return self.ring_dir / "settings.json"
+
+    def save_settings(self):
+        self.ring_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.settings_path.with_name(f"settings.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({name: getattr(self, name) for name in RUNTIME_SETTINGS}))
+        os.replace(tmp, self.settings_path)
+        self._settings_mtime = self.settings_path.stat().st_mtime_ns
+
+    def refresh(self, force: bool = False):
+        """Reload runtime settings if another worker changed them (checked at most once a second)."""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        self._next_check = now + SETTINGS_CHECK_INTERVAL
+        try:
+            mtime = self.settings_path.stat().st_mtime_ns
+            if mtime == self._settings_mtime:
+                return
+            data = json.loads(self.settings_path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning("Could not read profiling settings from %s", self.settings_path)
+            return
+        self._settings_mtime = mtime
+        for name in RUNTIME_SETTINGS:
+            if name in data:
+                setattr(self, name, float(data[name]))
+
+
+@dataclass
+class RequestTimings:
+    db_seconds: float = 0.0
+    db_calls: int = 0
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+# DB timing: wrap the Motor database so every awaited call is charged to the current request
+async def _timed(awaitable):
+    timings = _request_timings.get()
+    if timings is None:
+        return await awaitable
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings.db_seconds += time.perf_counter() - start
+        timings.db_calls += 1
+
+
+def _wrap_result(result):
+    if inspect.isawaitable(result):
+        return _timed(result)
+    if hasattr(result, "to_list"):
+        # Cursors are built lazily and only hit the server on to_list()
+        return _TimedProxy(result)
+    return result
+
+
+class _TimedProxy:
+    """Wraps a Motor collection or cursor, timing the awaitables it returns."""
+    __slots__ = ("_target",)
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            return _wrap_result(attr(*args, **kwargs))
+        return wrapper
+
+
+class TimedDatabase:
+    """Drop-in stand-in for an AsyncIOMotorDatabase that records DB time per request."""
+    __slots__ = ("_db", "_collection_cls")
+
+    def __init__(self, db):
+        from motor.motor_asyncio import AsyncIOMotorCollection
+        self._db = db
+        self._collection_cls = AsyncIOMotorCollection
+
+    def __getitem__(self, name):
+        return _TimedProxy(self._db[name])
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if isinstance(attr, self._collection_cls):
+            return _TimedProxy(attr)
+        return attr
+
+
+# Statistical profiler
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's stack on a fixed interval from a background thread.
+
+    Requests share the event loop thread, so samples taken while the profiled
+    request is suspended show whatever else the loop was doing (usually idle in
+    the selector). That is the point: it shows where the wall time went.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.counts: Counter = Counter()
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.counts[_collapse(frame)] += 1
+
+
+class ProfileRing:
+    """Bounded on-disk ring of collapsed-stack files.
+
+    Files are named after the writing process so uvicorn workers sharing the
+    directory never write the same file; after each write the directory is
+    pruned to the newest ``size`` profiles across all workers, past and present.
+    """
+
+    def __init__(self, directory: Path, size: int):
+        self.directory = directory
+        self.size = size
+        self._seq = itertools.count()
+
+    def write(self, counts: Counter) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"profile-{os.getpid()}-{next(self._seq):06d}.folded"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp, path)
+        self._prune()
+        return path
+
+    def _prune(self):
+        def mtime(path):
+            try:
+                return path.stat().st_mtime_ns
+            except FileNotFoundError:  # pruned by another worker
+                return 0
+        profiles = sorted(self.directory.glob("profile-*.folded"), key=mtime)
+        for stale in profiles[:-self.size]:
+            stale.unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """Logs slow requests with a DB/CPU breakdown and profiles selected requests.
+
+    A request is profiled when it carries ``X-Profile: <PROFILE_TOKEN>`` or is
+    picked by ``sample_rate``. Only one request per worker is sampled at a time,
+    and paths under ``exclude_prefixes`` are never profiled.
+    """
+
+    def __init__(self, app, config: ProfilingConfig, exclude_prefixes=()):
+        self.app = app
+        self.config = config
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.ring = ProfileRing(config.ring_dir, config.ring_size)
+        self._busy = threading.Lock()
+
+    def _wants_profile(self, scope) -> bool:
+        if scope["path"].startswith(self.exclude_prefixes):
+            return False
+        for key, value in scope.get("headers", ()):
+            if key == PROFILE_HEADER:
+                return self.config.is_authorized(value)
+        return self.config.sample_rate > 0 and random.random() < self.config.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.config.refresh()
+        timings = RequestTimings()
+        reset_token = _request_timings.set(timings)
+        sampler = None
+        if self._wants_profile(scope) and self._busy.acquire(blocking=False):
+            sampler = StackSampler(threading.get_ident(), self.config.interval_ms / 1000).start()
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            cpu_ms = (time.thread_time() - cpu_start) * 1000
+            _request_timings.reset(reset_token)
+            label = f"{scope['method']} {scope['path']}"
+            if sampler is not None:
+                counts = sampler.stop()
+                self._busy.release()
+                try:
+                    path = await asyncio.to_thread(self.ring.write, counts)
+                    logger.info("Profiled %s (%.1fms, %d samples) -> %s", label, elapsed_ms, sum(counts.values()), path)
+                except OSError:
+                    logger.exception("Could not write profile for %s", label)
+            if elapsed_ms >= self.config.slow_request_ms:
+                # CPU is measured on the event loop thread, so it also includes
+                # whatever concurrent requests ran while this one was suspended
+                logger.warning(
+                    "Slow request %s: total=%.1fms db=%.1fms (%d calls) loop_cpu=%.1fms (shared with concurrent requests)",
+                    label, elapsed_ms, timings.db_seconds * 1000, timings.db_calls, cpu_ms,
+                )
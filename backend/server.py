@@ -1,36 +1,59 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter, ValidationError
+from typing import Any, List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from profiling import ProfilingConfig, ProfilingMiddleware, TimedDatabase
+from compression import CompressionMiddleware, PrecompressedCache
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# Clients are created lazily so importing this module does no I/O and skips the
+# Motor/passlib/jose import cost; the lifespan handler warms them before serving.
 
 # MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+@lru_cache(maxsize=None)
+def get_db():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    return TimedDatabase(client[os.environ['DB_NAME']])
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-change-this-in-production")
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+@lru_cache(maxsize=None)
+def get_jwt():
+    from jose import jwt
+    return jwt
+
+def get_secret_key():
+    return os.environ.get("SECRET_KEY", "your-secret-key-change-this-in-production")
+
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+MAX_PROGRESS_BATCH = 200
+DUPLICATE_KEY_ERROR = 11000
+
 security = HTTPBearer()
 
-# Create the main app
-app = FastAPI()
+# Response compression
+catalog_cache = PrecompressedCache()
+
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -73,6 +96,15 @@ class Video(BaseModel):
     duration: int  # in seconds
     order: int
 
+# Catalog responses serialize stored fields only, so defaults that would be
+# regenerated per request (id, created_at) are optional here rather than invented
+class CatalogCourse(Course):
+    id: Optional[str] = None
+    created_at: Optional[str] = None
+
+class CatalogVideo(Video):
+    id: Optional[str] = None
+
 class ProgressUpdate(BaseModel):
     user_id: str
     course_id: str
@@ -80,6 +112,10 @@ class ProgressUpdate(BaseModel):
     watched_duration: int  # in seconds
     completed: bool = False
 
+class ProgressBatch(BaseModel):
+    # Items are validated one by one so a single malformed entry doesn't reject the batch
+    updates: List[Any] = Field(min_length=1, max_length=MAX_PROGRESS_BATCH)
+
 class UserProgress(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -90,6 +126,10 @@ class UserProgress(BaseModel):
     completed: bool
     last_watched: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+class ProfilingSettings(BaseModel):
+    sample_rate: Optional[float] = Field(default=None, ge=0, le=1)
+    slow_request_ms: Optional[float] = Field(default=None, ge=0)
+
 class Certificate(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -99,21 +139,34 @@ class Certificate(BaseModel):
     course_name: str
     issued_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+course_list_adapter = TypeAdapter(List[CatalogCourse])
+course_adapter = TypeAdapter(CatalogCourse)
+video_list_adapter = TypeAdapter(List[CatalogVideo])
+
 # Helper functions
+def serialize_catalog(adapter: TypeAdapter, data) -> bytes:
+    # exclude_unset keeps the bytes (and so the cache key) identical for identical documents
+    return adapter.dump_json(adapter.validate_python(data), exclude_unset=True)
+
+async def catalog_response(request: Request, adapter: TypeAdapter, data):
+    # Serialized once per request; gzip/brotli variants are reused until the catalog changes
+    return await catalog_cache.response(request, serialize_catalog(adapter, data))
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = get_jwt().encode(to_encode, get_secret_key(), algorithm=ALGORITHM)
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    jwt = get_jwt()
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -121,23 +174,31 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     )
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, get_secret_key(), algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
-    except JWTError:
+    except jwt.JWTError:
         raise credentials_exception
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    user = await get_db().users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if user is None:
         raise credentials_exception
     return User(**user)
 
+def get_profiling_config(request: Request) -> ProfilingConfig:
+    return request.app.state.profiling_config
+
+def require_profiling_admin(x_profile: Optional[str] = Header(None), config: ProfilingConfig = Depends(get_profiling_config)):
+    # Starlette decodes headers as latin-1, so this recovers the raw bytes
+    if not config.is_authorized(x_profile.encode("latin-1") if x_profile else None):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
 # Auth routes
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_create: UserCreate):
     # Check if user exists
-    existing_user = await db.users.find_one({"email": user_create.email})
+    existing_user = await get_db().users.find_one({"email": user_create.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -147,7 +208,7 @@ async def register(user_create: UserCreate):
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
     
-    await db.users.insert_one(user_dict)
+    await get_db().users.insert_one(user_dict)
     
     # Create token
     access_token = create_access_token(data={"sub": user.id})
@@ -155,7 +216,7 @@ async def register(user_create: UserCreate):
 
 @api_router.post("/auth/login", response_model=Token)
 async def login(user_login: UserLogin):
-    user = await db.users.find_one({"email": user_login.email})
+    user = await get_db().users.find_one({"email": user_login.email})
     if not user or not verify_password(user_login.password, user["password"]):
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     
@@ -168,28 +229,31 @@ async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Course routes
-@api_router.get("/courses", response_model=List[Course])
-async def get_courses(search: Optional[str] = None, language: Optional[str] = None):
+@api_router.get("/courses", response_model=List[CatalogCourse])
+async def get_courses(request: Request, search: Optional[str] = None, language: Optional[str] = None):
     query = {}
     if search:
         query["name"] = {"$regex": search, "$options": "i"}
     if language:
         query["language"] = language.lower()
     
-    courses = await db.courses.find(query, {"_id": 0}).to_list(1000)
-    return courses
+    courses = await get_db().courses.find(query, {"_id": 0}).to_list(1000)
+    if search:
+        # Free-text results are too varied to precompress; CompressionMiddleware handles them
+        return Response(content=serialize_catalog(course_list_adapter, courses), media_type="application/json")
+    return await catalog_response(request, course_list_adapter, courses)
 
-@api_router.get("/courses/{course_id}", response_model=Course)
-async def get_course(course_id: str):
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+@api_router.get("/courses/{course_id}", response_model=CatalogCourse)
+async def get_course(request: Request, course_id: str):
+    course = await get_db().courses.find_one({"id": course_id}, {"_id": 0})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    return course
+    return await catalog_response(request, course_adapter, course)
 
-@api_router.get("/courses/{course_id}/videos", response_model=List[Video])
-async def get_course_videos(course_id: str):
-    videos = await db.videos.find({"course_id": course_id}, {"_id": 0}).sort("order", 1).to_list(1000)
-    return videos
+@api_router.get("/courses/{course_id}/videos", response_model=List[CatalogVideo])
+async def get_course_videos(request: Request, course_id: str):
+    videos = await get_db().videos.find({"course_id": course_id}, {"_id": 0}).sort("order", 1).to_list(1000)
+    return await catalog_response(request, video_list_adapter, videos)
 
 # Progress routes
 @api_router.post("/progress/update")
@@ -199,7 +263,7 @@ async def update_progress(progress: ProgressUpdate, current_user: User = Depends
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # Update or create progress
-    existing_progress = await db.progress.find_one({
+    existing_progress = await get_db().progress.find_one({
         "user_id": progress.user_id,
         "course_id": progress.course_id,
         "video_id": progress.video_id
@@ -209,21 +273,106 @@ async def update_progress(progress: ProgressUpdate, current_user: User = Depends
     progress_dict = progress_obj.model_dump()
     
     if existing_progress:
-        await db.progress.update_one(
+        await get_db().progress.update_one(
             {"user_id": progress.user_id, "course_id": progress.course_id, "video_id": progress.video_id},
             {"$set": progress_dict}
         )
     else:
-        await db.progress.insert_one(progress_dict)
+        await get_db().progress.insert_one(progress_dict)
     
     return {"status": "success"}
 
+@api_router.post("/progress/batch")
+async def batch_update_progress(batch: ProgressBatch, current_user: User = Depends(get_current_user)):
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+    
+    results = []
+    
+    # Merge updates for the same video: furthest position wins, completion is sticky
+    merged = {}
+    for i, item in enumerate(batch.updates):
+        try:
+            update = ProgressUpdate.model_validate(item)
+        except ValidationError as e:
+            results.append({
+                "index": i,
+                "video_id": item.get("video_id") if isinstance(item, dict) else None,
+                "status": "error",
+                "detail": e.errors(include_url=False, include_context=False),
+            })
+            continue
+        results.append({"index": i, "video_id": update.video_id, "status": "success"})
+        if update.user_id != current_user.id:
+            results[i].update(status="error", detail="Not authorized")
+            continue
+        key = (update.course_id, update.video_id)
+        if key in merged:
+            entry = merged[key]
+            entry["watched_duration"] = max(entry["watched_duration"], update.watched_duration)
+            entry["completed"] = entry["completed"] or update.completed
+            entry["indexes"].append(i)
+        else:
+            merged[key] = {"watched_duration": update.watched_duration, "completed": update.completed, "indexes": [i]}
+    
+    if merged:
+        # Pipeline update keeps stored progress monotonic against stale or out-of-order
+        # replays, and only bumps last_watched when the position or completion moves
+        last_watched = datetime.now(timezone.utc).isoformat()
+        operations = []
+        op_indexes = []
+        for (course_id, video_id), entry in merged.items():
+            advanced = {"$or": [
+                {"$gt": [entry["watched_duration"], {"$ifNull": ["$watched_duration", -1]}]},
+                {"$and": [entry["completed"], {"$not": [{"$ifNull": ["$completed", False]}]}]},
+            ]}
+            operations.append(UpdateOne(
+                {"user_id": current_user.id, "course_id": course_id, "video_id": video_id},
+                [{"$set": {
+                    "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+                    "watched_duration": {"$max": ["$watched_duration", entry["watched_duration"]]},
+                    "completed": {"$or": [{"$ifNull": ["$completed", False]}, entry["completed"]]},
+                    "last_watched": {"$cond": [advanced, last_watched, "$last_watched"]},
+                }}],
+                upsert=True,
+            ))
+            op_indexes.append(entry["indexes"])
+        
+        # A duplicate key means a concurrent request upserted the same video first
+        # (the unique index caught it); retrying once turns the insert into an update
+        pending = list(range(len(operations)))
+        for attempt in range(2):
+            try:
+                await get_db().progress.bulk_write([operations[j] for j in pending], ordered=False)
+                break
+            except BulkWriteError as e:
+                retry = []
+                for error in e.details.get("writeErrors", []):
+                    op = pending[error["index"]]
+                    if error.get("code") == DUPLICATE_KEY_ERROR and attempt == 0:
+                        retry.append(op)
+                        continue
+                    for i in op_indexes[op]:
+                        results[i].update(status="error", detail=error.get("errmsg", "Write failed"))
+                if not retry:
+                    break
+                pending = retry
+    
+    succeeded = sum(r["status"] == "success" for r in results)
+    if succeeded == len(results):
+        batch_status = "success"
+    elif succeeded:
+        batch_status = "partial"
+    else:
+        batch_status = "error"
+    return {"status": batch_status, "results": results}
+
 @api_router.get("/progress/user/{user_id}/course/{course_id}")
 async def get_user_course_progress(user_id: str, course_id: str, current_user: User = Depends(get_current_user)):
     if user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    progress = await db.progress.find(
+    progress = await get_db().progress.find(
         {"user_id": user_id, "course_id": course_id},
         {"_id": 0}
     ).to_list(1000)
@@ -237,7 +386,7 @@ async def generate_certificate(user_id: str, course_id: str, current_user: User
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # Check if certificate already exists
-    existing_cert = await db.certificates.find_one(
+    existing_cert = await get_db().certificates.find_one(
         {"user_id": user_id, "course_id": course_id},
         {"_id": 0}
     )
@@ -245,7 +394,7 @@ async def generate_certificate(user_id: str, course_id: str, current_user: User
         return Certificate(**existing_cert)
     
     # Get course details
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+    course = await get_db().courses.find_one({"id": course_id}, {"_id": 0})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
@@ -257,7 +406,7 @@ async def generate_certificate(user_id: str, course_id: str, current_user: User
         course_name=course["name"]
     )
     cert_dict = certificate.model_dump()
-    await db.certificates.insert_one(cert_dict)
+    await get_db().certificates.insert_one(cert_dict)
     
     return certificate
 
@@ -266,7 +415,7 @@ async def get_certificate(user_id: str, course_id: str, current_user: User = Dep
     if user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    certificate = await db.certificates.find_one(
+    certificate = await get_db().certificates.find_one(
         {"user_id": user_id, "course_id": course_id},
         {"_id": 0}
     )
@@ -276,23 +425,75 @@ async def get_certificate(user_id: str, course_id: str, current_user: User = Dep
     
     return Certificate(**certificate)
 
-# Include router
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# Admin routes
+@api_router.get("/admin/profiling", dependencies=[Depends(require_profiling_admin)])
+async def get_profiling_settings(config: ProfilingConfig = Depends(get_profiling_config)):
+    config.refresh(force=True)
+    return {"sample_rate": config.sample_rate, "slow_request_ms": config.slow_request_ms}
+
+@api_router.put("/admin/profiling", dependencies=[Depends(require_profiling_admin)])
+async def update_profiling_settings(settings: ProfilingSettings, config: ProfilingConfig = Depends(get_profiling_config)):
+    config.refresh(force=True)
+    if settings.sample_rate is not None:
+        config.sample_rate = settings.sample_rate
+    if settings.slow_request_ms is not None:
+        config.slow_request_ms = settings.slow_request_ms
+    # Shared through PROFILE_DIR so every worker applies the change, not just this one
+    config.save_settings()
+    return await get_profiling_settings(config)
+
+# Application factory
+async def ensure_indexes():
+    from pymongo.errors import PyMongoError
+    try:
+        # Lets concurrent batch upserts for the same video collide instead of duplicating
+        await get_db().progress.create_index(
+            [("user_id", 1), ("course_id", 1), ("video_id", 1)], unique=True
+        )
+    except PyMongoError:
+        logger.exception("Could not create unique progress index")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pay for the deferred imports, client creation and bcrypt backend load once per
+    # worker at startup instead of inside the first user request
+    get_db()
+    get_pwd_context().handler().get_backend()
+    get_jwt()
+    # Runs in the background so a slow or unreachable Mongo doesn't hold up startup
+    index_task = asyncio.create_task(ensure_indexes())
+    yield
+    index_task.cancel()
+    if get_db.cache_info().currsize:
+        get_db().client.close()
+        get_db.cache_clear()
+
+def create_app() -> FastAPI:
+    load_dotenv(ROOT_DIR / '.env')
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    app = FastAPI(lifespan=lifespan)
+    app.state.profiling_config = ProfilingConfig.from_env()
+    app.include_router(api_router)
+    
+    app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get("COMPRESS_MIN_SIZE", "1024")))
+    app.add_middleware(ProfilingMiddleware, config=app.state.profiling_config, exclude_prefixes=("/api/admin/",))
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
+
+def __getattr__(name):
+    # `uvicorn server:app` still works, but the app is only built when asked for
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -186,6 +186,31 @@ class LevelUpHiveAPITester:
                 
         return None, []
 
+    def test_catalog_compression(self):
+        """Test precompressed catalog responses and ETag revalidation"""
+        print("\n🗜️ Testing Catalog Compression...")
+        
+        url = f"{self.api_url}/courses"
+        try:
+            response = requests.get(url, headers={'Accept-Encoding': 'br, gzip'}, timeout=10)
+            encoding = response.headers.get('Content-Encoding')
+            etag = response.headers.get('ETag')
+            self.log_test(
+                "Catalog Compressed",
+                response.status_code == 200 and encoding in ('br', 'gzip') and bool(etag),
+                f"Status: {response.status_code}, Content-Encoding: {encoding}, ETag: {etag}"
+            )
+            if not etag:
+                return
+            
+            response = requests.get(url, headers={'Accept-Encoding': 'br, gzip', 'If-None-Match': etag}, timeout=10)
+            self.log_test("Catalog Revalidation", response.status_code == 304, f"Status: {response.status_code}")
+            
+            response = requests.get(url, headers={'Accept-Encoding': 'br, gzip', 'If-None-Match': f'W/{etag}'}, timeout=10)
+            self.log_test("Catalog Weak Revalidation", response.status_code == 304, f"Status: {response.status_code}")
+        except Exception as e:
+            self.log_test("Catalog Compression", False, f"Error: {str(e)}")
+
     def test_progress_api(self, course_id, videos):
         """Test progress tracking API"""
         print("\n📊 Testing Progress API...")
@@ -235,6 +260,56 @@ class LevelUpHiveAPITester:
             200,
             data=progress_data
         )
+        
+        # Batch sync: a stale replay must not roll back completion, and a malformed
+        # entry is reported per item instead of rejecting the batch
+        batch_data = {
+            "updates": [
+                dict(progress_data, watched_duration=10, completed=False),
+                dict(progress_data, video_id=videos[-1]['id'], watched_duration=5),
+                {"video_id": "malformed-entry"}
+            ]
+        }
+        
+        success, response = self.run_test(
+            "Batch Progress Sync",
+            "POST",
+            "progress/batch",
+            200,
+            data=batch_data
+        )
+        
+        if success:
+            statuses = [r.get('status') for r in response.get('results', [])]
+            self.log_test("Batch Item Results", statuses == ["success", "success", "error"] and response.get('status') == "partial", f"Statuses: {statuses}")
+            
+            success, progress = self.run_test(
+                "Get Progress After Batch",
+                "GET",
+                f"progress/user/{self.user_id}/course/{course_id}",
+                200
+            )
+            first = next((p for p in progress if p['video_id'] == video['id']), {})
+            self.log_test("Batch Merge Monotonic", first.get('completed') is True, f"Completed: {first.get('completed')}")
+
+    def test_admin_api(self):
+        """Test admin endpoints reject requests without the profiling token"""
+        print("\n🔧 Testing Admin API...")
+        
+        self.run_test(
+            "Profiling Settings Without Token",
+            "GET",
+            "admin/profiling",
+            403
+        )
+        
+        self.run_test(
+            "Profiling Settings With Wrong Token",
+            "GET",
+            "admin/profiling",
+            403,
+            headers={'X-Profile': 'not-the-token'}
+        )
 
     def test_certificate_api(self, course_id):
         """Test certificate generation API"""
@@ -278,6 +353,7 @@ class LevelUpHiveAPITester:
         
         # Test courses
         course_id, videos = self.test_courses_api()
+        self.test_catalog_compression()
         
         # Test progress tracking
         if course_id and videos:
@@ -286,6 +362,9 @@ class LevelUpHiveAPITester:
             # Test certificate generation
             self.test_certificate_api(course_id)
         
+        # Test admin endpoints
+        self.test_admin_api()
+        
         # Print summary
         print(f"\n📊 Test Summary:")
         print(f"Tests run: {self.tests_run}")
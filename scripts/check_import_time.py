@@ -0,0 +1,122 @@
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+
+# Modules that importing server.py must not load (the lifespan handler loads the
+# clients at worker startup, which measure_ready() accounts for)
+DEFERRED_MODULES = ['motor', 'pymongo', 'passlib', 'jose', 'pandas', 'numpy', 'boto3']
+
+def measure(module):
+    """Import `module` in a fresh interpreter with -X importtime and parse the report.
+
+    Returns a list of (name, self_us, cumulative_us, depth) tuples in import order.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+def measure_ready(module):
+    """Time a fresh worker from interpreter start of `import module` to the end of lifespan startup.
+
+    This is what uvicorn waits for before the worker accepts connections. Returns
+    (import_ms, ready_ms).
+    """
+    snippet = (
+        "import asyncio, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module} as mod\n"
+        "imported = time.perf_counter()\n"
+        "app = mod.create_app()\n"
+        "async def startup():\n"
+        "    async with app.router.lifespan_context(app):\n"
+        "        return time.perf_counter()\n"
+        "ready = asyncio.run(startup())\n"
+        "print((imported - start) * 1000, (ready - start) * 1000)\n"
+    )
+    # The Mongo client connects lazily, so a placeholder URL is enough to build it
+    env = {'MONGO_URL': 'mongodb://localhost:27017', 'DB_NAME': 'import_check', **os.environ}
+    result = subprocess.run(
+        [sys.executable, '-c', snippet],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"Starting {module} failed:\n{result.stderr}")
+    import_ms, ready_ms = result.stdout.split()[-2:]
+    return float(import_ms), float(ready_ms)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check backend worker start-up time against a budget")
+    parser.add_argument('--module', default='server')
+    parser.add_argument('--import-budget-ms', type=float, default=float(os.environ.get('IMPORT_BUDGET_MS', '500')),
+                        help="budget for a bare import (test collection, scripts)")
+    parser.add_argument('--ready-budget-ms', type=float, default=float(os.environ.get('READY_BUDGET_MS', '750')),
+                        help="budget for import + create_app() + lifespan startup")
+    parser.add_argument('--runs', type=int, default=5, help="take the fastest of this many fresh workers")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    entries = measure(args.module)
+    index = next((i for i, entry in enumerate(entries) if entry[0] == args.module and entry[3] == 0), None)
+    if index is None:
+        sys.exit(f"{args.module} not found at top level of the -X importtime report")
+    imported = {name.split('.')[0] for name, _, _, _ in entries}
+
+    # -X importtime reports children before their parent, so the module's direct
+    # imports are the depth-1 entries just above it
+    children = []
+    for name, _, cumulative_us, depth in reversed(entries[:index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((cumulative_us, name))
+
+    # The fastest run is the least disturbed by disk cache and scheduler noise
+    runs = max(args.runs, 1)
+    import_ms, ready_ms = min((measure_ready(args.module) for _ in range(runs)), key=lambda r: r[1])
+
+    print(f"Best of {runs} fresh workers:")
+    print(f"  import {args.module}:             {import_ms:8.1f}ms (budget {args.import_budget_ms:.0f}ms)")
+    print(f"  create_app + lifespan startup: {ready_ms - import_ms:8.1f}ms")
+    print(f"  worker ready:                  {ready_ms:8.1f}ms (budget {args.ready_budget_ms:.0f}ms)")
+    print(f"\nSlowest imports made by {args.module}:")
+    for cumulative_us, name in sorted(children, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}ms  {name}")
+
+    failed = False
+    eager = [m for m in DEFERRED_MODULES if m in imported]
+    if eager:
+        print(f"\n❌ Imported eagerly (should be deferred): {', '.join(eager)}")
+        failed = True
+    if import_ms > args.import_budget_ms:
+        print(f"\n❌ Import over budget by {import_ms - args.import_budget_ms:.1f}ms")
+        failed = True
+    if ready_ms > args.ready_budget_ms:
+        print(f"\n❌ Worker start-up over budget by {ready_ms - args.ready_budget_ms:.1f}ms")
+        failed = True
+    if not failed:
+        print("\n✅ Within budget")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())